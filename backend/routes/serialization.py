@@ -0,0 +1,290 @@
+"""Streaming, negotiated serialization for list endpoints.
+
+List endpoints hand `stream_list` an iterable of response dicts (usually a
+generator over a MongoDB cursor) instead of building the whole list and
+calling `jsonify`. The response body is produced in chunks of `CHUNK_SIZE`
+items, so memory stays flat however long the list is.
+
+The first chunk is pulled before the response is built, so a failing query or
+a malformed first document still raises inside the route and gives the usual
+JSON 500. An error later in the stream can't change the status any more; it is
+logged and re-raised, so the server aborts the response without the closing
+bracket, compressor trailer or final empty chunk. Clients see a truncated
+body or a dropped connection, never a short list that looks complete.
+
+The representation is negotiated per request:
+
+- `Accept: application/x-msgpack` returns a MessagePack stream, one map per
+  item, to be read with `msgpack.Unpacker`. Otherwise the body is a JSON array.
+- `Accept-Encoding` picks brotli (`br`) or gzip compression of the stream.
+- `?compact=1` leaves out fields that equal the endpoint's defaults (zero
+  counters, empty strings, the generated avatar URL). The version served is
+  echoed in `X-Compact-Version`; clients must fill the defaults back in.
+
+Run the benchmark from the backend folder:
+
+    python -m routes.serialization --count 50000
+"""
+import argparse
+import json
+import logging
+import traceback
+import zlib
+from itertools import chain, islice
+
+from flask import Response, request, stream_with_context
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+COMPACT_VERSION = 1
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/x-msgpack"
+
+
+def omit_defaults(item, defaults):
+    """Drop fields equal to their default. Callable defaults are given the item."""
+    compact = {}
+    for key, value in item.items():
+        default = defaults.get(key)
+        if callable(default):
+            default = default(item)
+        if key in defaults and value == default:
+            continue
+        compact[key] = value
+    return compact
+
+
+def chunked(items, size=CHUNK_SIZE):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_json(items):
+    """Yield a JSON array one chunk of items at a time"""
+    yield b"["
+    first = True
+    for chunk in chunked(items):
+        # One dumps call per chunk, without the chunk's own brackets
+        body = json.dumps(chunk, separators=(",", ":"))[1:-1]
+        yield (body if first else "," + body).encode("utf-8")
+        first = False
+    yield b"]"
+
+
+def encode_msgpack(items):
+    """Yield a MessagePack stream of items, one chunk at a time"""
+    packer = msgpack.Packer()
+    for chunk in chunked(items):
+        yield b"".join(packer.pack(item) for item in chunk)
+
+
+def compress(chunks, encoding):
+    """Compress a stream of byte chunks with `gzip` or `br`"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=4)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        # wbits=31 writes a gzip header and trailer
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def negotiate():
+    """Pick (mimetype, content encoding, compact version) for the current request"""
+    mimetype = JSON_MIMETYPE
+    if msgpack is not None:
+        best = request.accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE)
+        if best == MSGPACK_MIMETYPE:
+            mimetype = MSGPACK_MIMETYPE
+
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+
+    compact = COMPACT_VERSION if request.args.get("compact", type=int) == COMPACT_VERSION else None
+    return mimetype, encoding, compact
+
+
+def guarded(items):
+    """Log an error raised mid-stream, then let it abort the response"""
+    try:
+        yield from items
+    except Exception as e:
+        logger.error(f"Error while streaming response, aborting it: {str(e)}")
+        traceback.print_exc()
+        raise
+
+
+def stream_list(items, defaults=None):
+    """Stream `items` as a negotiated response. `defaults` are used for compact output.
+
+    Must be called inside the route's `try` so errors in the first chunk
+    propagate to it.
+    """
+    mimetype, encoding, compact = negotiate()
+
+    # Run the query and format the first chunk while a 500 can still be returned
+    items = iter(items)
+    first = list(islice(items, CHUNK_SIZE))
+    items = chain(first, guarded(items))
+
+    if compact and defaults:
+        items = (omit_defaults(item, defaults) for item in items)
+
+    body = encode_msgpack(items) if mimetype == MSGPACK_MIMETYPE else encode_json(items)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    if compact:
+        headers["X-Compact-Version"] = str(COMPACT_VERSION)
+
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+
+def sample_documents(count):
+    """Synthetic tweets, users, comments and follower cards for the benchmark"""
+    from routes.tweet_routes import format_tweet
+    from routes.user_routes import format_user, format_user_card
+
+    def tweets():
+        for i in range(count):
+            yield format_tweet({
+                "_id": f"{i:024x}",
+                "content": f"Tweet number {i} about #nosql and #mongodb",
+                "authorId": f"{i % 1000:024x}",
+                "createdAt": "2024-01-01T12:00:00.000Z",
+                "likes": i % 7 and i % 50,
+                "images": [],
+            })
+
+    def users():
+        for i in range(count):
+            yield format_user({
+                "_id": f"{i:024x}",
+                "name": f"User {i}",
+                "username": f"user{i}",
+                "avatar": f"https://api.dicebear.com/7.x/adventurer/svg?seed=user{i}",
+                "following": i % 30,
+                "followers": i % 3 and i % 200,
+            }, False)
+
+    def comments():
+        for i in range(count):
+            yield {
+                "id": f"{i:024x}",
+                "content": f"Reply {i}",
+                "createdAt": "2024-01-01T12:00:00.000Z",
+                "likes": 0,
+                "author": {
+                    "id": f"{i % 1000:024x}",
+                    "name": f"User {i % 1000}",
+                    "username": f"user{i % 1000}",
+                    "avatar": f"https://api.dicebear.com/7.x/adventurer/svg?seed=user{i % 1000}",
+                },
+            }
+
+    def followers():
+        for i in range(count):
+            yield format_user_card({
+                "_id": f"{i:024x}",
+                "name": f"User {i}",
+                "username": f"user{i}",
+                "avatar": f"https://api.dicebear.com/7.x/adventurer/svg?seed=user{i}",
+            })
+
+    return {"tweets": tweets, "users": users, "comments": comments, "followers": followers}
+
+
+def benchmark(count=20000):
+    """Report bytes on the wire, CPU time and peak memory per endpoint and encoding"""
+    import time
+    import tracemalloc
+
+    from flask import Flask
+
+    from routes.tweet_routes import TWEET_DEFAULTS, COMMENT_DEFAULTS
+    from routes.user_routes import USER_DEFAULTS, USER_CARD_DEFAULTS
+
+    defaults = {
+        "tweets": TWEET_DEFAULTS,
+        "users": USER_DEFAULTS,
+        "comments": COMMENT_DEFAULTS,
+        "followers": USER_CARD_DEFAULTS,
+    }
+
+    # The baseline is exactly what the endpoints used to return
+    app = Flask(__name__)
+
+    def materialised(make_items):
+        with app.app_context():
+            yield app.json.response(list(make_items())).get_data()
+
+    variants = [
+        ("jsonify list", lambda make_items, _: materialised(make_items)),
+        ("json stream", lambda make_items, _: encode_json(make_items())),
+        ("json + gzip", lambda make_items, _: compress(encode_json(make_items()), "gzip")),
+        ("compact json + gzip", lambda make_items, d: compress(
+            encode_json(omit_defaults(item, d) for item in make_items()), "gzip")),
+    ]
+    if brotli is not None:
+        variants.append(("json + br", lambda make_items, _: compress(encode_json(make_items()), "br")))
+        variants.append(("compact json + br", lambda make_items, d: compress(
+            encode_json(omit_defaults(item, d) for item in make_items()), "br")))
+    if msgpack is not None:
+        variants.append(("msgpack", lambda make_items, _: encode_msgpack(make_items())))
+        variants.append(("compact msgpack + gzip", lambda make_items, d: compress(
+            encode_msgpack(omit_defaults(item, d) for item in make_items()), "gzip")))
+
+    logger.info(f"{count} items per endpoint")
+    logger.info(f"{'endpoint':<10} {'encoding':<24} {'bytes':>12} {'cpu ms':>9} {'peak KB':>10}")
+    for endpoint, make_items in sample_documents(count).items():
+        for name, encode in variants:
+            started = time.process_time()
+            size = sum(len(chunk) for chunk in encode(make_items, defaults[endpoint]))
+            cpu_ms = (time.process_time() - started) * 1000
+
+            # Measured in a second pass so tracing doesn't skew the CPU time
+            tracemalloc.start()
+            for _ in encode(make_items, defaults[endpoint]):
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            logger.info(f"{endpoint:<10} {name:<24} {size:>12} {cpu_ms:>9.0f} {peak / 1024:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list endpoint serialization")
+    parser.add_argument("--count", type=int, default=20000, help="Items per endpoint")
+    args = parser.parse_args()
+    benchmark(args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 from flask import Blueprint, request, jsonify
 from config import mongo
+from services.archive import feed_page, find_archived_comments, find_archived_tweets
+from routes.serialization import stream_list
 from bson.objectid import ObjectId
 import traceback
 import logging
 from datetime import datetime
+from itertools import chain
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,6 +14,36 @@ logger = logging.getLogger(__name__)
 
 tweet_routes = Blueprint("tweet_routes", __name__)
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+def format_tweet(tweet):
+    return {
+        "id": str(tweet["_id"]),
+        "content": tweet["content"],
+        "authorId": tweet["authorId"],
+        "createdAt": tweet["createdAt"],
+        "likes": tweet.get("likes", 0),
+        "retweets": tweet.get("retweets", 0),
+        "replies": tweet.get("replies", 0),
+        "images": tweet.get("images", []),
+        "location": tweet.get("location", ""),
+        "scheduledDate": tweet.get("scheduledDate", ""),
+    }
+
+# Fields left out of compact (?compact=1) list responses when they hold these values
+TWEET_DEFAULTS = {
+    "likes": 0,
+    "retweets": 0,
+    "replies": 0,
+    "images": [],
+    "location": "",
+    "scheduledDate": "",
+}
+COMMENT_DEFAULTS = {
+    "likes": 0,
+}
+
 @tweet_routes.route("/", methods=["GET"])
 def get_tweets():
     try:
@@ -19,20 +52,16 @@ def get_tweets():
             logger.error("MongoDB connection not established")
             return jsonify({"error": "Database connection error"}), 500
             
-        tweets = list(mongo.db.tweets.find().sort("createdAt", -1))
-        logger.info(f"Found {len(tweets)} tweets in the database")
-        return jsonify([{
-            "id": str(tweet["_id"]),
-            "content": tweet["content"],
-            "authorId": tweet["authorId"],
-            "createdAt": tweet["createdAt"],
-            "likes": tweet.get("likes", 0),
-            "retweets": tweet.get("retweets", 0),
-            "replies": tweet.get("replies", 0),
-            "images": tweet.get("images", []),
-            "location": tweet.get("location", ""),
-            "scheduledDate": tweet.get("scheduledDate", ""),
-        } for tweet in tweets])
+        # Cursor pagination, newest first:
+        # ?limit=20&before=<createdAt of the last tweet seen>&beforeId=<its id>
+        limit = request.args.get("limit", DEFAULT_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        before = request.args.get("before")
+        before_id = request.args.get("beforeId")
+
+        tweets = (format_tweet(tweet) for tweet in feed_page(mongo.db, before, before_id, limit))
+
+        return stream_list(tweets, TWEET_DEFAULTS)
     except Exception as e:
         logger.error(f"Error getting tweets: {str(e)}")
         traceback.print_exc()
@@ -145,7 +174,11 @@ def add_comment(tweet_id):
         # Update the tweet's reply count
         mongo.db.tweets.update_one(
             {"_id": ObjectId(tweet_id)},
-            {"$inc": {"replies": 1}}
+            {
+                "$inc": {"replies": 1},
+                # Lets the counter reconciliation job pick this tweet up
+                "$currentDate": {"countersTouchedAt": True}
+            }
         )
         
         return jsonify({
@@ -161,52 +194,58 @@ def add_comment(tweet_id):
 def get_comments(tweet_id):
     try:
         # Fetch comments for the tweet
-        comments = list(mongo.db.comments.find({"tweetId": tweet_id}).sort("createdAt", 1))
+        comments = mongo.db.comments.find({"tweetId": tweet_id}).sort("createdAt", 1)
+
+        # Comments on an archived tweet may have been archived too
+        if ObjectId.is_valid(tweet_id) and not mongo.db.tweets.find_one({"_id": ObjectId(tweet_id)}, {"_id": 1}):
+            archived = find_archived_tweets(mongo.db, [ObjectId(tweet_id)])
+            if archived:
+                comments = chain(find_archived_comments(mongo.db, tweet_id, archived[0]["createdAt"][:7]), comments)
         
         # Format the comments for response
-        formatted_comments = []
-        for comment in comments:
-            try:
-                # Get author info
+        def formatted_comments():
+            for comment in comments:
                 try:
-                    author_id = comment["authorId"]
+                    # Get author info
                     try:
-                        author_obj_id = ObjectId(author_id)
-                        author = mongo.db.users.find_one({"_id": author_obj_id})
-                    except:
-                        author = mongo.db.users.find_one({"_id": author_id})
+                        author_id = comment["authorId"]
+                        try:
+                            author_obj_id = ObjectId(author_id)
+                            author = mongo.db.users.find_one({"_id": author_obj_id})
+                        except:
+                            author = mongo.db.users.find_one({"_id": author_id})
                     
-                    if not author:
-                        # Use placeholder author if not found
-                        author = {
-                            "_id": comment["authorId"],
-                            "name": "Unknown User",
-                            "username": "unknown",
-                            "avatar": "https://api.dicebear.com/7.x/adventurer/svg?seed=Unknown"
-                        }
+                        if not author:
+                            # Use placeholder author if not found
+                            author = {
+                                "_id": comment["authorId"],
+                                "name": "Unknown User",
+                                "username": "unknown",
+                                "avatar": "https://api.dicebear.com/7.x/adventurer/svg?seed=Unknown"
+                            }
                         
-                    # Format the comment
-                    formatted_comment = {
-                        "id": str(comment["_id"]),
-                        "content": comment["content"],
-                        "createdAt": comment["createdAt"],
-                        "likes": comment.get("likes", 0),
-                        "author": {
-                            "id": str(author["_id"]),
-                            "name": author["name"],
-                            "username": author["username"],
-                            "avatar": author.get("avatar", "https://api.dicebear.com/7.x/adventurer/svg?seed=Default"),
+                        # Format the comment
+                        formatted_comment = {
+                            "id": str(comment["_id"]),
+                            "content": comment["content"],
+                            "createdAt": comment["createdAt"],
+                            "likes": comment.get("likes", 0),
+                            "author": {
+                                "id": str(author["_id"]),
+                                "name": author["name"],
+                                "username": author["username"],
+                                "avatar": author.get("avatar", "https://api.dicebear.com/7.x/adventurer/svg?seed=Default"),
+                            }
                         }
-                    }
-                    formatted_comments.append(formatted_comment)
-                except Exception as author_err:
-                    logger.error(f"Error processing author for comment: {str(author_err)}")
-                    traceback.print_exc()
-            except Exception as comment_err:
-                logger.error(f"Error processing comment: {str(comment_err)}")
-                continue
+                        yield formatted_comment
+                    except Exception as author_err:
+                        logger.error(f"Error processing author for comment: {str(author_err)}")
+                        traceback.print_exc()
+                except Exception as comment_err:
+                    logger.error(f"Error processing comment: {str(comment_err)}")
+                    continue
                 
-        return jsonify(formatted_comments)
+        return stream_list(formatted_comments(), COMMENT_DEFAULTS)
     except Exception as e:
         logger.error(f"Error getting comments: {str(e)}")
         traceback.print_exc()
@@ -236,7 +275,11 @@ def delete_comment(comment_id):
         tweet_id = comment["tweetId"]
         mongo.db.tweets.update_one(
             {"_id": ObjectId(tweet_id)},
-            {"$inc": {"replies": -1}}
+            {
+                "$inc": {"replies": -1},
+                # Lets the counter reconciliation job pick this tweet up
+                "$currentDate": {"countersTouchedAt": True}
+            }
         )
         
         return jsonify({"message": "Comment deleted successfully"}), 200
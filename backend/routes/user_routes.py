@@ -1,11 +1,58 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import mongo
+from services.archive import find_archived_tweets
+from routes.serialization import stream_list
 from bson.objectid import ObjectId
 import traceback  # Add missing import
 
 user_routes = Blueprint("user_routes", __name__)
 
+def default_avatar(username):
+    return f"https://api.dicebear.com/7.x/adventurer/svg?seed={username}"
+
+def format_user(user, is_following):
+    return {
+        "id": str(user.get("_id")),
+        "name": user.get("name"),
+        "username": user.get("username"),
+        "bio": user.get("bio", ""),
+        "avatar": user.get("avatar", ""),
+        "following": user.get("following", 0),
+        "followers": user.get("followers", 0),
+        "isFollowing": is_following
+    }
+
+def in_list_order(users, ids):
+    """Yield `users` in the order their IDs appear in a follow list"""
+    by_id = {user["_id"]: user for user in users}
+    for user_id in ids:
+        if user_id in by_id:
+            yield by_id[user_id]
+
+def format_user_card(user):
+    return {
+        "id": str(user["_id"]),
+        "name": user.get("name"),
+        "username": user.get("username"),
+        "avatar": user.get("avatar", ""),
+        "bio": user.get("bio", "")
+    }
+
+USER_CARD_PROJECTION = {"name": 1, "username": 1, "avatar": 1, "bio": 1}
+
+# Fields left out of compact (?compact=1) list responses when they hold these values
+USER_CARD_DEFAULTS = {
+    "bio": "",
+    "avatar": lambda user: default_avatar(user.get("username")),
+}
+USER_DEFAULTS = {
+    **USER_CARD_DEFAULTS,
+    "following": 0,
+    "followers": 0,
+    "isFollowing": False,
+}
+
 @user_routes.route("/", methods=["GET"])
 def get_users():
     try:
@@ -13,37 +60,25 @@ def get_users():
         current_user_id = request.args.get('userId')
         
         # Get all users
-        users = list(mongo.db.users.find({}, {
+        users = mongo.db.users.find({}, {
             "password": 0  # Exclude password field
-        }))
+        })
         
-        result = []
-        for user in users:
-            # Skip current user if specified
-            if current_user_id and str(user.get("_id")) == current_user_id:
-                continue
+        def result():
+            for user in users:
+                # Skip current user if specified
+                if current_user_id and str(user.get("_id")) == current_user_id:
+                    continue
                 
-            # Convert ObjectId to string
-            user_id = str(user.get("_id"))
-            
-            # Check if current user is following this user
-            is_following = False
-            if current_user_id:
-                # Check if current user exists in this user's followers
-                is_following = current_user_id in [str(follower) for follower in user.get("followers_list", [])]
-            
-            result.append({
-                "id": user_id,
-                "name": user.get("name"),
-                "username": user.get("username"),
-                "bio": user.get("bio", ""),
-                "avatar": user.get("avatar", ""),
-                "following": user.get("following", 0),
-                "followers": user.get("followers", 0),
-                "isFollowing": is_following
-            })
+                # Check if current user is following this user
+                is_following = False
+                if current_user_id:
+                    # Check if current user exists in this user's followers
+                    is_following = current_user_id in [str(follower) for follower in user.get("followers_list", [])]
+                
+                yield format_user(user, is_following)
             
-        return jsonify(result)
+        return stream_list(result(), USER_DEFAULTS)
     except Exception as e:
         print(f"Error getting users: {str(e)}")
         traceback.print_exc()
@@ -75,7 +110,7 @@ def signup():
             "following": 0,
             "followers": 0,
             # Add a default avatar 
-            "avatar": f"https://api.dicebear.com/7.x/adventurer/svg?seed={data['username']}",
+            "avatar": default_avatar(data["username"]),
             "tweets": []
         }
         result = mongo.db.users.insert_one(user)
@@ -106,7 +141,7 @@ def login():
 
         # Add a default avatar if none exists
         if not user.get("avatar"):
-            user["avatar"] = f"https://api.dicebear.com/7.x/adventurer/svg?seed={user['username']}"
+            user["avatar"] = default_avatar(user["username"])
 
         return jsonify({
             "id": str(user["_id"]),
@@ -139,8 +174,13 @@ def get_user_tweets(user_id):
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    tweet_ids = user.get("tweets", [])
-    tweets = mongo.db.tweets.find({"_id": {"$in": [ObjectId(tweet_id) for tweet_id in tweet_ids]}})
+    tweet_ids = [ObjectId(tweet_id) for tweet_id in user.get("tweets", [])]
+    tweets = list(mongo.db.tweets.find({"_id": {"$in": tweet_ids}}))
+
+    # Older tweets may have been moved to the archive
+    if len(tweets) < len(tweet_ids):
+        hot_ids = {tweet["_id"] for tweet in tweets}
+        tweets.extend(find_archived_tweets(mongo.db, [tweet_id for tweet_id in tweet_ids if tweet_id not in hot_ids]))
     return jsonify([{
         "id": str(tweet["_id"]),
         "content": tweet["content"],
@@ -257,7 +297,8 @@ def follow_user(target_user_id):
             {"_id": current_user_obj_id},
             {
                 "$push": {"following_list": target_user_id},
-                "$inc": {"following": 1}
+                "$inc": {"following": 1},
+                "$currentDate": {"countersTouchedAt": True}
             }
         )
         
@@ -266,7 +307,8 @@ def follow_user(target_user_id):
             {"_id": target_user_obj_id},
             {
                 "$push": {"followers_list": current_user_id},
-                "$inc": {"followers": 1}
+                "$inc": {"followers": 1},
+                "$currentDate": {"countersTouchedAt": True}
             }
         )
         
@@ -308,7 +350,8 @@ def unfollow_user(target_user_id):
             {"_id": current_user_obj_id},
             {
                 "$pull": {"following_list": target_user_id},
-                "$inc": {"following": -1}
+                "$inc": {"following": -1},
+                "$currentDate": {"countersTouchedAt": True}
             }
         )
         
@@ -317,7 +360,8 @@ def unfollow_user(target_user_id):
             {"_id": target_user_obj_id},
             {
                 "$pull": {"followers_list": current_user_id},
-                "$inc": {"followers": -1}
+                "$inc": {"followers": -1},
+                "$currentDate": {"countersTouchedAt": True}
             }
         )
         
@@ -341,27 +385,13 @@ def get_user_followers(user_id):
         if not user:
             return jsonify({"error": "User not found"}), 404
             
-        # Get followers list
-        followers_list = user.get("followers_list", [])
-        followers = []
-        
-        # Get details for each follower
-        for follower_id in followers_list:
-            try:
-                follower_obj_id = ObjectId(follower_id)
-                follower = mongo.db.users.find_one({"_id": follower_obj_id})
-                if follower:
-                    followers.append({
-                        "id": str(follower["_id"]),
-                        "name": follower["name"],
-                        "username": follower["username"],
-                        "avatar": follower.get("avatar", ""),
-                        "bio": follower.get("bio", "")
-                    })
-            except Exception as e:
-                print(f"Error processing follower {follower_id}: {str(e)}")
+        # Get details for all followers in one query
+        follower_ids = [ObjectId(follower_id) for follower_id in user.get("followers_list", [])
+                        if ObjectId.is_valid(follower_id)]
+        followers = mongo.db.users.find({"_id": {"$in": follower_ids}}, USER_CARD_PROJECTION)
                 
-        return jsonify(followers)
+        return stream_list((format_user_card(follower) for follower in in_list_order(followers, follower_ids)),
+                           USER_CARD_DEFAULTS)
     except Exception as e:
         print(f"Error getting followers: {str(e)}")
         traceback.print_exc()
@@ -381,32 +411,50 @@ def get_user_following(user_id):
         if not user:
             return jsonify({"error": "User not found"}), 404
             
-        # Get following list
-        following_list = user.get("following_list", [])
-        following = []
-        
-        # Get details for each followed user
-        for following_id in following_list:
-            try:
-                following_obj_id = ObjectId(following_id)
-                followed_user = mongo.db.users.find_one({"_id": following_obj_id})
-                if followed_user:
-                    following.append({
-                        "id": str(followed_user["_id"]),
-                        "name": followed_user["name"],
-                        "username": followed_user["username"],
-                        "avatar": followed_user.get("avatar", ""),
-                        "bio": followed_user.get("bio", "")
-                    })
-            except Exception as e:
-                print(f"Error processing following {following_id}: {str(e)}")
+        # Get details for all followed users in one query
+        following_ids = [ObjectId(following_id) for following_id in user.get("following_list", [])
+                         if ObjectId.is_valid(following_id)]
+        following = mongo.db.users.find({"_id": {"$in": following_ids}}, USER_CARD_PROJECTION)
                 
-        return jsonify(following)
+        return stream_list((format_user_card(followed_user) for followed_user in in_list_order(following, following_ids)),
+                           USER_CARD_DEFAULTS)
     except Exception as e:
         print(f"Error getting following: {str(e)}")
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@user_routes.route("/<user_id>/suggestions", methods=["GET"])
+def get_user_suggestions(user_id):
+    try:
+        # Suggestions are precomputed by services/suggestions.py
+        suggestions = mongo.db.suggestions.find_one({"_id": user_id}, {"suggestions": 1})
+        if not suggestions:
+            return jsonify([])
+
+        # Leave out anyone followed since the suggestions were computed
+        try:
+            user = mongo.db.users.find_one({"_id": ObjectId(user_id)}, {"following_list": 1})
+        except:
+            user = mongo.db.users.find_one({"_id": user_id}, {"following_list": 1})
+        following = set((user or {}).get("following_list", []))
+
+        return stream_list(({
+            "id": suggestion["id"],
+            "name": suggestion.get("name"),
+            "username": suggestion.get("username"),
+            "bio": suggestion.get("bio", ""),
+            "avatar": suggestion.get("avatar", ""),
+            "following": suggestion.get("following", 0),
+            "followers": suggestion.get("followers", 0),
+            "mutualCount": suggestion.get("mutualCount", 0),
+            "isFollowing": False
+        } for suggestion in suggestions.get("suggestions", [])
+            if suggestion["id"] not in following), USER_DEFAULTS)
+    except Exception as e:
+        print(f"Error getting suggestions: {str(e)}")
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
 @user_routes.route("/username/<username>", methods=["GET"])
 def get_user_by_username(username):
     try:
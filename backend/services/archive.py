@@ -0,0 +1,312 @@
+"""Hot/cold tiering of tweets and comments.
+
+Tweets and comments older than a configurable age are moved out of the hot
+`tweets`/`comments` collections into one archive collection per month
+(`tweets_archive_YYYY_MM`, `comments_archive_YYYY_MM`) created with zstd block
+compression. Only the hot collections and their indexes need to fit in RAM.
+
+The job works in batches, oldest first. Each batch is upserted into the archive
+before it is deleted from the hot collection, so an interrupted run is simply
+picked up again by the next one. The delete only matches documents that still
+look like the archived snapshot; anything updated in between (say a `$inc` on
+`replies`) stays hot and is archived again, with its new values, by the next
+run.
+
+Comments follow their tweet: tweets are archived first, and a comment is only
+moved once its tweet is no longer hot, however old the comment is. A hot tweet
+therefore always has all of its comments hot, which is what `get_comments` and
+the counter reconciliation job rely on.
+
+The read helpers here let routes fall through to the archive. Each run records
+the cutoff it archives below in `job_checkpoints`; a feed page only reads the
+archive once it reaches past that boundary, and then merges hot and archived
+tweets, since a tweet that was busy during the run stays hot among older
+archived ones. Lookups by ID check the archive for anything no longer hot.
+Archived documents are read-only.
+
+Run from the backend folder:
+
+    python -m services.archive --max-age-days 90
+"""
+import argparse
+import heapq
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import islice
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, DeleteOne, ReplaceOne
+from pymongo.errors import CollectionInvalid
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "archive"
+ARCHIVED_COLLECTIONS = ("tweets", "comments")
+DEFAULT_MAX_AGE_DAYS = 90
+DEFAULT_BATCH_SIZE = 1000
+ARCHIVE_STORAGE_ENGINE = {"wiredTiger": {"configString": "block_compressor=zstd"}}
+ARCHIVE_INDEXES = {
+    "tweets": [[("createdAt", DESCENDING), ("_id", DESCENDING)], [("authorId", ASCENDING)]],
+    "comments": [[("tweetId", ASCENDING), ("createdAt", ASCENDING)]],
+}
+# Fields the app updates in place; a hot document is only deleted if they still match
+SNAPSHOT_FIELDS = {
+    "tweets": ("replies", "countersTouchedAt"),
+    "comments": ("likes",),
+}
+
+
+def archive_name(collection_name, month):
+    """`tweets`, `2024-01` -> `tweets_archive_2024_01`"""
+    return f"{collection_name}_archive_{month.replace('-', '_')}"
+
+
+def archive_months(db, collection_name):
+    """Months that have an archive collection, newest first"""
+    prefix = f"{collection_name}_archive_"
+    names = db.list_collection_names(filter={"name": {"$regex": f"^{prefix}"}})
+    return sorted((name[len(prefix):].replace("_", "-") for name in names), reverse=True)
+
+
+def get_archive_collection(db, collection_name, month):
+    """Return the archive collection for a month, creating it compressed if needed"""
+    name = archive_name(collection_name, month)
+    if name not in db.list_collection_names(filter={"name": name}):
+        try:
+            db.create_collection(name, storageEngine=ARCHIVE_STORAGE_ENGINE)
+        except CollectionInvalid:
+            # Created by a concurrent run
+            pass
+        for keys in ARCHIVE_INDEXES[collection_name]:
+            db[name].create_index(keys)
+    return db[name]
+
+
+def feed_cursor(before=None, before_id=None):
+    """Filter for a newest-first feed continuing below `(before, before_id)`.
+
+    Sorting on `(createdAt, _id)` keeps tweets that share a timestamp from being
+    skipped at a page boundary. Without `before_id` it falls back to
+    `createdAt < before`.
+    """
+    if not before:
+        return {}
+    if before_id is None:
+        return {"createdAt": {"$lt": before}}
+    if isinstance(before_id, str) and ObjectId.is_valid(before_id):
+        before_id = ObjectId(before_id)
+    return {"$or": [
+        {"createdAt": {"$lt": before}},
+        {"createdAt": before, "_id": {"$lt": before_id}},
+    ]}
+
+
+def feed_key(tweet):
+    return tweet["createdAt"], tweet["_id"]
+
+
+def archive_boundary(db):
+    """Everything in the tweet archive was created before this, or None if nothing is"""
+    state = db.job_checkpoints.find_one({"_id": JOB_NAME}) or {}
+    return state.get("archivedBefore")
+
+
+def feed_page(db, before=None, before_id=None, limit=20):
+    """One newest-first page of tweets below `(before, before_id)`, hot and archived.
+
+    The archive is only queried when the hot page is short or reaches below the
+    archive boundary; the two are then merged on `(createdAt, _id)`.
+    """
+    query = feed_cursor(before, before_id)
+    hot = list(db.tweets.find(query).sort([("createdAt", DESCENDING), ("_id", DESCENDING)]).limit(limit))
+
+    boundary = archive_boundary(db)
+    if boundary is None or (len(hot) == limit and hot[-1]["createdAt"] >= boundary):
+        return hot
+    archived = iter_archived_tweets(db, before, before_id, limit)
+    return list(islice(unique_tweets(heapq.merge(hot, archived, key=feed_key, reverse=True)), limit))
+
+
+def unique_tweets(tweets):
+    """Drop the archived copy of a tweet whose hot delete was skipped; the hot one comes first"""
+    last_key = None
+    for tweet in tweets:
+        if feed_key(tweet) != last_key:
+            yield tweet
+        last_key = feed_key(tweet)
+
+
+def snapshot_filter(collection_name, doc):
+    """Match a document only if its mutable fields are unchanged since it was read"""
+    query = {"_id": doc["_id"]}
+    for field in SNAPSHOT_FIELDS[collection_name]:
+        query[field] = doc[field] if field in doc else {"$exists": False}
+    return query
+
+
+def hot_tweet_ids(db, tweet_ids):
+    """The subset of string tweet IDs that are still in the hot collection"""
+    object_ids = [ObjectId(tweet_id) for tweet_id in set(tweet_ids) if ObjectId.is_valid(tweet_id)]
+    return {str(tweet["_id"]) for tweet in db.tweets.find({"_id": {"$in": object_ids}}, {"_id": 1})}
+
+
+def archive_batch(db, collection_name, cutoff, batch_size, after=None):
+    """Move one batch of documents created before `cutoff`, continuing past `after`.
+
+    Returns `(read, moved, position)` where `position` is the `(createdAt, _id)`
+    of the last document read. Documents changed while the batch was being
+    archived, and comments whose tweet is still hot, stay in the hot
+    collection for the next run.
+    """
+    query = {"createdAt": {"$lt": cutoff}}
+    if after is not None:
+        query = {"$and": [query, {"$or": [
+            {"createdAt": {"$gt": after[0]}},
+            {"createdAt": after[0], "_id": {"$gt": after[1]}},
+        ]}]}
+    read = list(db[collection_name].find(query)
+                .sort([("createdAt", ASCENDING), ("_id", ASCENDING)]).limit(batch_size))
+    if not read:
+        return 0, 0, after
+    position = (read[-1]["createdAt"], read[-1]["_id"])
+
+    docs = read
+    if collection_name == "comments":
+        hot = hot_tweet_ids(db, [doc["tweetId"] for doc in read])
+        docs = [doc for doc in read if doc["tweetId"] not in hot]
+        if not docs:
+            return len(read), 0, position
+
+    # createdAt is an ISO timestamp, so its first 7 characters are the month
+    by_month = defaultdict(list)
+    for doc in docs:
+        by_month[doc["createdAt"][:7]].append(doc)
+
+    for month, month_docs in by_month.items():
+        archive = get_archive_collection(db, collection_name, month)
+        archive.bulk_write(
+            [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in month_docs],
+            ordered=False
+        )
+
+    result = db[collection_name].bulk_write(
+        [DeleteOne(snapshot_filter(collection_name, doc)) for doc in docs],
+        ordered=False
+    )
+    if result.deleted_count < len(docs):
+        logger.info(f"{len(docs) - result.deleted_count} {collection_name} changed while archiving, "
+                    f"leaving them for the next run")
+    return len(read), result.deleted_count, position
+
+
+def hot_set_size(db):
+    """Document count and data/index sizes of the hot collections"""
+    sizes = {}
+    for collection_name in ARCHIVED_COLLECTIONS:
+        stats = db.command("collstats", collection_name)
+        sizes[collection_name] = {
+            "count": stats.get("count", 0),
+            "dataSizeMB": round(stats.get("size", 0) / 1024 / 1024, 1),
+            "indexSizeMB": round(stats.get("totalIndexSize", 0) / 1024 / 1024, 1),
+        }
+    return sizes
+
+
+def run_archive(db, max_age_days=DEFAULT_MAX_AGE_DAYS, batch_size=DEFAULT_BATCH_SIZE, max_batches=None):
+    """Archive everything older than `max_age_days`. Returns moved counts and the hot-set size."""
+    cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+    for collection_name in ARCHIVED_COLLECTIONS:
+        db[collection_name].create_index([("createdAt", ASCENDING), ("_id", ASCENDING)])
+
+    # Recorded before anything moves so feeds never miss a freshly archived tweet
+    db.job_checkpoints.update_one(
+        {"_id": JOB_NAME},
+        {"$max": {"archivedBefore": cutoff}, "$set": {"updatedAt": datetime.utcnow()}},
+        upsert=True
+    )
+
+    # Tweets go first so their comments can follow them in the same run
+    moved = {}
+    for collection_name in ARCHIVED_COLLECTIONS:
+        moved[collection_name] = 0
+        batches = 0
+        position = None
+        while max_batches is None or batches < max_batches:
+            read, count, position = archive_batch(db, collection_name, cutoff, batch_size, position)
+            if not read:
+                break
+            moved[collection_name] += count
+            batches += 1
+        logger.info(f"Archived {moved[collection_name]} {collection_name} created before {cutoff}")
+
+    sizes = hot_set_size(db)
+    for collection_name, size in sizes.items():
+        logger.info(
+            f"Hot {collection_name}: {size['count']} docs, "
+            f"{size['dataSizeMB']}MB data, {size['indexSizeMB']}MB indexes"
+        )
+    return {"moved": moved, "hotSet": sizes}
+
+
+def find_archived_tweets(db, tweet_ids):
+    """Look up tweets by ObjectId in the archive, newest month first"""
+    remaining = set(tweet_ids)
+    found = []
+    for month in archive_months(db, "tweets"):
+        if not remaining:
+            break
+        for tweet in db[archive_name("tweets", month)].find({"_id": {"$in": list(remaining)}}):
+            remaining.discard(tweet["_id"])
+            found.append(tweet)
+    return found
+
+
+def find_archived_comments(db, tweet_id, since_month):
+    """Archived comments on a tweet, oldest first, from `since_month` onwards"""
+    comments = []
+    for month in sorted(archive_months(db, "comments")):
+        if month >= since_month:
+            comments.extend(db[archive_name("comments", month)].find({"tweetId": tweet_id}).sort("createdAt", 1))
+    return comments
+
+
+def iter_archived_tweets(db, before=None, before_id=None, limit=None):
+    """Continue a newest-first feed into the archive, starting below `(before, before_id)`"""
+    if limit is not None and limit <= 0:
+        return
+    query = feed_cursor(before, before_id)
+    for month in archive_months(db, "tweets"):
+        if before and month > before[:7]:
+            continue
+        cursor = db[archive_name("tweets", month)].find(query).sort([("createdAt", -1), ("_id", -1)])
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        for tweet in cursor:
+            yield tweet
+            if limit is not None:
+                limit -= 1
+                if limit == 0:
+                    return
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old tweets and comments to compressed monthly archives")
+    parser.add_argument("--max-age-days", type=int, default=DEFAULT_MAX_AGE_DAYS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None,
+                        help="Stop after this many batches per collection")
+    args = parser.parse_args()
+
+    # Importing the app initialises the shared MongoDB connection
+    from app import app  # noqa: F401
+    from config import mongo
+
+    run_archive(mongo.db, max_age_days=args.max_age_days, batch_size=args.batch_size,
+                max_batches=args.max_batches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""Bulk import and export of users, tweets and comments.
+
+Documents are streamed as NDJSON (MongoDB relaxed extended JSON, one document
+per line) or as concatenated BSON, chosen by file extension. Nothing is held in
+memory beyond the batches in flight.
+
+Imports are split into batches that parallel worker processes decode, remap and
+write with unordered `insert_many`. IDs are remapped without any lookup table:
+valid ObjectIds are kept as they are, anything else (or everything, with
+`--remap-ids`) is turned into a deterministic ObjectId derived from the
+original value, so references in `authorId`, `tweetId`, `tweets` and the follow
+lists resolve to the same documents in whatever order the files are loaded.
+Secondary indexes are built once the load has finished.
+
+Exports page through each collection by `_id`. Exporting tweets or comments
+also writes each monthly archive collection (`tweets_archive_YYYY_MM` etc.) to
+its own file; restore those by importing them as `--tweets`/`--comments` and
+rerunning the archive job.
+
+`generate` writes synthetic dumps for benchmarking, and `import --dry-run`
+decodes and remaps without writing, which measures the client side on its own.
+
+Run from the backend folder:
+
+    python -m services.bulk_data import --users users.ndjson --tweets tweets.ndjson --comments comments.ndjson
+    python -m services.bulk_data export --out-dir backup --format bson
+    python -m services.bulk_data generate --out-dir sample --tweets 1000000
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import struct
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+from itertools import islice
+
+import bson
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import BulkWriteError
+
+from services.counter_reconciliation import ensure_indexes, server_time
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = ("users", "tweets", "comments")
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_WORKERS = os.cpu_count() or 4
+
+# Which ID space each reference field belongs to
+REFERENCE_FIELDS = {
+    "users": {
+        "_id": "users",
+        "following_list": "users",
+        "followers_list": "users",
+        "tweets": "tweets",
+    },
+    "tweets": {
+        "_id": "tweets",
+        "authorId": "users",
+    },
+    "comments": {
+        "_id": "comments",
+        "authorId": "users",
+        "tweetId": "tweets",
+    },
+}
+
+# Stamped on imported documents so the counter reconciliation job checks them
+COUNTER_COLLECTIONS = ("users", "tweets")
+
+# The worker process's database handle, set by init_worker
+worker_db = None
+
+
+def get_mongo_uri():
+    """Return the MongoDB URI the Flask app is configured with"""
+    from app import app
+    return app.config["MONGO_URI"]
+
+
+def map_id(space, value, salt=None):
+    """Map an original ID to the ObjectId it is stored under.
+
+    Without a salt valid ObjectIds are kept; any other value is hashed into a
+    deterministic ObjectId. With a salt every ID is hashed, which gives a fresh,
+    collision-free ID set when merging a dump into a database that already
+    holds it.
+    """
+    value = str(value)
+    if salt is None and ObjectId.is_valid(value):
+        return ObjectId(value)
+    digest = hashlib.sha1(f"{salt or ''}:{space}:{value}".encode("utf-8")).digest()
+    return ObjectId(digest[:12])
+
+
+def remap_document(collection_name, doc, salt=None):
+    """Rewrite a document's `_id` and references in place"""
+    # API responses use "id" instead of "_id"
+    original_id = doc.pop("_id", None)
+    if "id" in doc:
+        api_id = doc.pop("id")
+        if original_id is None:
+            original_id = api_id
+
+    for field, space in REFERENCE_FIELDS[collection_name].items():
+        if field == "_id":
+            doc["_id"] = ObjectId() if original_id is None else map_id(space, original_id, salt)
+        elif isinstance(doc.get(field), list):
+            doc[field] = [str(map_id(space, ref, salt)) for ref in doc[field]]
+        elif doc.get(field) is not None:
+            # References are stored as strings throughout the app
+            doc[field] = str(map_id(space, doc[field], salt))
+    return doc
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "bson" if path.endswith(".bson") else "ndjson"
+
+
+def iter_raw_records(path, fmt):
+    """Yield undecoded records so decoding happens in the worker processes"""
+    if fmt == "bson":
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(4)
+                if not header:
+                    break
+                size = struct.unpack("<i", header)[0] if len(header) == 4 else 0
+                body = f.read(size - 4) if size > 4 else b""
+                if len(body) < size - 4 or size <= 4:
+                    # Hand the truncated record on so it is counted as failed
+                    logger.warning(f"Truncated BSON record at the end of {path}")
+                    yield header + body
+                    break
+                yield header + body
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def iter_batches(records, batch_size):
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def decode_record(record, fmt):
+    if fmt == "bson":
+        return bson.decode(record)
+    return json.loads(record, object_hook=json_util.object_hook)
+
+
+def init_worker(uri):
+    global worker_db
+    # No URI means a dry run: decode and remap only
+    worker_db = MongoClient(uri).get_default_database() if uri else None
+
+
+def import_batch(collection_name, fmt, records, salt):
+    """Decode, remap and insert one batch. Returns (inserted, failed)."""
+    docs = []
+    failed = 0
+    for record in records:
+        try:
+            doc = remap_document(collection_name, decode_record(record, fmt), salt)
+        except Exception as e:
+            # A malformed line or truncated record shouldn't abort the whole import
+            logger.warning(f"Skipping unreadable {collection_name} record: {str(e)}")
+            failed += 1
+            continue
+        docs.append(doc)
+
+    if not docs or worker_db is None:
+        return len(docs), failed
+
+    if collection_name in COUNTER_COLLECTIONS:
+        # Stamped with the server clock at insert, like `$currentDate`, so a
+        # reconciliation run during a long import can't checkpoint past them
+        touched_at = server_time(worker_db)
+        for doc in docs:
+            doc["countersTouchedAt"] = touched_at
+
+    try:
+        result = worker_db[collection_name].insert_many(docs, ordered=False)
+        return len(result.inserted_ids), failed
+    except BulkWriteError as e:
+        # Unordered inserts keep going past duplicates; report what failed
+        failed += len(e.details.get("writeErrors", []))
+        return e.details.get("nInserted", 0), failed
+
+
+class ThroughputReporter:
+    """Logs running totals and documents per second"""
+
+    def __init__(self, label, every=100000):
+        self.label = label
+        self.every = every
+        self.count = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.next_report = every
+
+    def add(self, count, failed=0):
+        self.count += count
+        self.failed += failed
+        if self.count >= self.next_report:
+            self.report()
+            self.next_report = self.count + self.every
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed else 0.0
+
+    def report(self, done=False):
+        elapsed = time.perf_counter() - self.started
+        prefix = "Finished" if done else "Progress"
+        logger.info(
+            f"{prefix} {self.label}: {self.count} docs ({self.failed} failed) "
+            f"in {elapsed:.1f}s, {self.rate():.0f} docs/s"
+        )
+
+
+def build_indexes(db):
+    """Create the secondary indexes after the load so inserts don't maintain them"""
+    db.users.create_index([("username", ASCENDING)])
+    db.users.create_index([("email", ASCENDING)])
+    db.tweets.create_index([("createdAt", DESCENDING)])
+    db.tweets.create_index([("authorId", ASCENDING)])
+    db.comments.create_index([("tweetId", ASCENDING), ("createdAt", ASCENDING)])
+    ensure_indexes(db)
+
+
+def import_collections(uri, sources, fmt=None, batch_size=DEFAULT_BATCH_SIZE,
+                       workers=DEFAULT_WORKERS, remap_ids=False):
+    """Import each `collection -> path` in `sources` and return per-collection totals.
+
+    With `uri=None` nothing is written (a dry run).
+    """
+    salt = uuid.uuid4().hex if remap_ids else None
+    # Enough batches queued to keep every worker busy without buffering the file
+    max_in_flight = workers * 2
+    totals = {}
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(uri,)) as pool:
+        for collection_name in COLLECTIONS:
+            path = sources.get(collection_name)
+            if not path:
+                continue
+            path_format = detect_format(path, fmt)
+            reporter = ThroughputReporter(collection_name)
+            pending = set()
+
+            for batch in iter_batches(iter_raw_records(path, path_format), batch_size):
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        reporter.add(*future.result())
+                pending.add(pool.submit(import_batch, collection_name, path_format, batch, salt))
+
+            for future in wait(pending).done:
+                reporter.add(*future.result())
+            reporter.report(done=True)
+            totals[collection_name] = {
+                "inserted": reporter.count,
+                "failed": reporter.failed,
+                "docsPerSecond": round(reporter.rate()),
+            }
+
+    if not uri:
+        return totals
+
+    client = MongoClient(uri)
+    started = time.perf_counter()
+    build_indexes(client.get_default_database())
+    logger.info(f"Built indexes in {time.perf_counter() - started:.1f}s")
+    return totals
+
+
+def generate_sample(out_dir, num_users, num_tweets, num_comments, fmt="ndjson", seed=0):
+    """Write synthetic users, tweets and comments with non-ObjectId IDs.
+
+    IDs look like `u12`/`t34`/`c56`, so an import exercises the ID remapping of
+    every reference field. Returns `collection -> path`.
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    paths = {}
+
+    def users():
+        for i in range(num_users):
+            yield {
+                "_id": f"u{i}",
+                "name": f"User {i}",
+                "username": f"user{i}",
+                "email": f"user{i}@example.com",
+                "password": "imported",
+                "following_list": [f"u{rng.randrange(num_users)}" for _ in range(rng.randrange(20))],
+                "followers_list": [f"u{rng.randrange(num_users)}" for _ in range(rng.randrange(20))],
+                "following": 0,
+                "followers": 0,
+                # Tweet i belongs to user i % num_users
+                "tweets": [f"t{t}" for t in range(i, num_tweets, num_users)],
+            }
+
+    def tweets():
+        for i in range(num_tweets):
+            yield {
+                "_id": f"t{i}",
+                "content": f"Tweet number {i} about #nosql and #mongodb",
+                "authorId": f"u{i % num_users}",
+                "createdAt": (start + timedelta(seconds=i * 7)).isoformat(),
+                "likes": rng.randrange(100),
+                "retweets": 0,
+                "replies": 0,
+                "images": [],
+                "location": "",
+                "scheduledDate": "",
+            }
+
+    def comments():
+        for i in range(num_comments):
+            yield {
+                "_id": f"c{i}",
+                "content": f"Reply {i}",
+                "authorId": f"u{rng.randrange(num_users)}",
+                "tweetId": f"t{rng.randrange(num_tweets)}",
+                "createdAt": (start + timedelta(seconds=i * 11)).isoformat(),
+                "likes": 0,
+            }
+
+    os.makedirs(out_dir, exist_ok=True)
+    for collection_name, docs in (("users", users), ("tweets", tweets), ("comments", comments)):
+        path = os.path.join(out_dir, f"{collection_name}.{fmt}")
+        with open(path, "wb" if fmt == "bson" else "w", encoding=None if fmt == "bson" else "utf-8") as f:
+            for doc in docs():
+                if fmt == "bson":
+                    f.write(bson.encode(doc))
+                else:
+                    f.write(json.dumps(doc))
+                    f.write("\n")
+        paths[collection_name] = path
+        logger.info(f"Wrote {path}")
+    return paths
+
+
+def export_names(db, collections):
+    """Collections to export, including the monthly archives of tweets and comments"""
+    from services.archive import ARCHIVED_COLLECTIONS, archive_months, archive_name
+
+    names = []
+    for collection_name in collections:
+        names.append(collection_name)
+        if collection_name in ARCHIVED_COLLECTIONS:
+            names.extend(archive_name(collection_name, month) for month in archive_months(db, collection_name))
+    return names
+
+
+def export_collection(db, collection_name, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Write a collection to `path`, paging by `_id` so no cursor stays open long"""
+    fmt = detect_format(path, fmt)
+    reporter = ThroughputReporter(collection_name)
+    last_id = None
+
+    with open(path, "wb" if fmt == "bson" else "w", encoding=None if fmt == "bson" else "utf-8") as f:
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            docs = list(db[collection_name].find(query).sort("_id", ASCENDING).limit(batch_size))
+            if not docs:
+                break
+            for doc in docs:
+                if fmt == "bson":
+                    f.write(bson.encode(doc))
+                else:
+                    f.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS))
+                    f.write("\n")
+            last_id = docs[-1]["_id"]
+            reporter.add(len(docs))
+
+    reporter.report(done=True)
+    return reporter.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import and export users, tweets and comments")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="Load NDJSON/BSON dumps")
+    for collection_name in COLLECTIONS:
+        import_parser.add_argument(f"--{collection_name}", help=f"File with {collection_name} to import")
+    import_parser.add_argument("--format", choices=("ndjson", "bson"), default=None,
+                               help="Override the format detected from the file extension")
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    import_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    import_parser.add_argument("--remap-ids", action="store_true",
+                               help="Give every document a new ID, e.g. to load the same dump twice")
+    import_parser.add_argument("--dry-run", action="store_true",
+                               help="Decode and remap without writing to MongoDB")
+
+    export_parser = subparsers.add_parser("export", help="Dump collections to NDJSON/BSON")
+    export_parser.add_argument("--out-dir", required=True)
+    export_parser.add_argument("--format", choices=("ndjson", "bson"), default="ndjson")
+    export_parser.add_argument("--collections", nargs="+", choices=COLLECTIONS, default=list(COLLECTIONS))
+    export_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    generate_parser = subparsers.add_parser("generate", help="Write synthetic dumps for benchmarking")
+    generate_parser.add_argument("--out-dir", required=True)
+    generate_parser.add_argument("--format", choices=("ndjson", "bson"), default="ndjson")
+    generate_parser.add_argument("--users", type=int, default=100000)
+    generate_parser.add_argument("--tweets", type=int, default=1000000)
+    generate_parser.add_argument("--comments", type=int, default=1000000)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate_sample(args.out_dir, args.users, args.tweets, args.comments, fmt=args.format)
+        return
+
+    uri = None if getattr(args, "dry_run", False) else get_mongo_uri()
+
+    if args.command == "import":
+        sources = {name: getattr(args, name) for name in COLLECTIONS if getattr(args, name)}
+        if not sources:
+            parser.error("Nothing to import: pass at least one of --users, --tweets or --comments")
+        import_collections(uri, sources, fmt=args.format, batch_size=args.batch_size,
+                           workers=args.workers, remap_ids=args.remap_ids)
+    else:
+        os.makedirs(args.out_dir, exist_ok=True)
+        db = MongoClient(uri).get_default_database()
+        for collection_name in export_names(db, args.collections):
+            path = os.path.join(args.out_dir, f"{collection_name}.{args.format}")
+            export_collection(db, collection_name, path, fmt=args.format, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""Incremental reconciliation of the denormalised reply/follower counters.
+
+The `replies`, `followers` and `following` counters are kept up to date with
+independent `$inc`s that are not transactional, so they drift under concurrent
+requests. Every write path that touches a counter also stamps the document with
+`countersTouchedAt` using the server clock (`$currentDate`); this job walks only
+the documents stamped since the last checkpoint, recomputes the counters with
+aggregation pipelines and repairs any drift with `bulk_write`.
+
+Stamps newer than `now - safety lag` (by the server clock) are left for the
+next run, so a write stamped just before a batch is read but applied after it
+is never skipped by a checkpoint that has already moved past it.
+
+Run it periodically from the backend folder:
+
+    python -m services.counter_reconciliation --batch-size 500
+"""
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, UpdateOne
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOB_NAME = "counter_reconciliation"
+TOUCHED_FIELD = "countersTouchedAt"
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_SAFETY_LAG_SECONDS = 60
+EPOCH = datetime(1970, 1, 1)
+
+
+def ensure_indexes(db):
+    """Create the indexes the job relies on so batches never scan a collection"""
+    db.tweets.create_index([(TOUCHED_FIELD, ASCENDING), ("_id", ASCENDING)])
+    db.users.create_index([(TOUCHED_FIELD, ASCENDING), ("_id", ASCENDING)])
+    db.comments.create_index([("tweetId", ASCENDING)])
+
+
+def load_checkpoint(db, collection_name):
+    """Return the (touchedAt, _id) position the previous run stopped at"""
+    state = db.job_checkpoints.find_one({"_id": JOB_NAME}) or {}
+    position = state.get(collection_name) or {}
+    return position.get("touchedAt", EPOCH), position.get("lastId")
+
+
+def save_checkpoint(db, collection_name, touched_at, last_id):
+    db.job_checkpoints.update_one(
+        {"_id": JOB_NAME},
+        {"$set": {
+            collection_name: {"touchedAt": touched_at, "lastId": last_id},
+            "updatedAt": datetime.utcnow(),
+        }},
+        upsert=True
+    )
+
+
+def server_time(db):
+    """Current time on the MongoDB server, the clock `$currentDate` stamps with"""
+    return db.command("isMaster")["localTime"]
+
+
+def touched_since(touched_at, last_id, until):
+    """Filter for documents stamped after the checkpoint position and before `until`"""
+    if last_id is None:
+        return {TOUCHED_FIELD: {"$gte": touched_at, "$lt": until}}
+    return {"$or": [
+        {TOUCHED_FIELD: {"$gt": touched_at, "$lt": until}},
+        {TOUCHED_FIELD: touched_at, "_id": {"$gt": last_id}},
+    ]}
+
+
+def dedupe(values):
+    """Drop repeated entries, keeping the first occurrence's position"""
+    return list(dict.fromkeys(values))
+
+
+def new_drift():
+    return {"documents": 0, "totalDrift": 0, "maxDrift": 0, "deduped": 0}
+
+
+def new_metrics():
+    """Drift seen in the batches read, and drift whose repair is known to have applied"""
+    return {"observed": new_drift(), "repaired": new_drift()}
+
+
+def record_drift(stats, drift, deduped=False):
+    if drift:
+        stats["documents"] += 1
+        stats["totalDrift"] += drift
+        stats["maxDrift"] = max(stats["maxDrift"], drift)
+    if deduped:
+        stats["deduped"] += 1
+
+
+def applied_updates(collection, stamps, modified_count):
+    """IDs whose compare-and-set repair was applied. `stamps` maps `_id` to the stamp read.
+
+    If fewer documents were modified than updates sent, only documents whose
+    stamp is still the one read are counted: those can't have been skipped. A
+    document touched since may or may not have been repaired, and is checked
+    again by the next run either way.
+    """
+    if modified_count == len(stamps):
+        return set(stamps)
+    return {
+        doc["_id"]
+        for doc in collection.find({"_id": {"$in": list(stamps)}}, {TOUCHED_FIELD: 1})
+        if doc.get(TOUCHED_FIELD) == stamps[doc["_id"]]
+    }
+
+
+def reconcile_tweets_batch(db, touched_at, last_id, until, batch_size, metrics):
+    """Recompute `replies` for one batch of touched tweets.
+
+    Returns the new checkpoint position, or None when nothing is left.
+    """
+    tweets = list(db.tweets.find(
+        touched_since(touched_at, last_id, until),
+        {"replies": 1, TOUCHED_FIELD: 1}
+    ).sort([(TOUCHED_FIELD, ASCENDING), ("_id", ASCENDING)]).limit(batch_size))
+    if not tweets:
+        return None
+
+    # Comments reference tweets by string ID. Only hot comments are counted:
+    # the archive job never moves a comment while its tweet is still hot
+    counts = {
+        row["_id"]: row["count"]
+        for row in db.comments.aggregate([
+            {"$match": {"tweetId": {"$in": [str(tweet["_id"]) for tweet in tweets]}}},
+            {"$group": {"_id": "$tweetId", "count": {"$sum": 1}}},
+        ])
+    }
+
+    operations = []
+    drifts = {}
+    stamps = {}
+    for tweet in tweets:
+        actual = counts.get(str(tweet["_id"]), 0)
+        drift = abs((tweet.get("replies") or 0) - actual)
+        if drift:
+            record_drift(metrics["replies"]["observed"], drift)
+            drifts[tweet["_id"]] = drift
+            stamps[tweet["_id"]] = tweet[TOUCHED_FIELD]
+            # Only overwrite if no request has touched the tweet since we read it;
+            # a newer stamp will be picked up by the next run
+            operations.append(UpdateOne(
+                {"_id": tweet["_id"], TOUCHED_FIELD: tweet[TOUCHED_FIELD]},
+                {"$set": {"replies": actual}}
+            ))
+
+    if operations:
+        result = db.tweets.bulk_write(operations, ordered=False)
+        metrics["tweets"]["repaired"] += result.modified_count
+        for tweet_id in applied_updates(db.tweets, stamps, result.modified_count):
+            record_drift(metrics["replies"]["repaired"], drifts[tweet_id])
+    metrics["tweets"]["scanned"] += len(tweets)
+
+    last = tweets[-1]
+    return last[TOUCHED_FIELD], last["_id"]
+
+
+def reconcile_users_batch(db, touched_at, last_id, until, batch_size, metrics):
+    """Recompute `followers` and `following` for one batch of touched users.
+
+    Counts are the number of distinct IDs in the follow lists. Duplicate entries
+    pushed by racing follow requests are removed from the lists in the same
+    update, otherwise a later unfollow would `$pull` every copy but only
+    decrement the counter once.
+    Returns the new checkpoint position, or None when nothing is left.
+    """
+    def distinct_size(list_field):
+        return {"$size": {"$setUnion": [{"$ifNull": [f"${list_field}", []]}, []]}}
+
+    def list_if_duplicated(list_field):
+        # Only ship the list back when it actually needs deduping
+        return {"$cond": [
+            {"$ne": [distinct_size(list_field), {"$size": {"$ifNull": [f"${list_field}", []]}}]},
+            f"${list_field}",
+            "$$REMOVE",
+        ]}
+
+    users = list(db.users.aggregate([
+        {"$match": touched_since(touched_at, last_id, until)},
+        {"$sort": {TOUCHED_FIELD: 1, "_id": 1}},
+        {"$limit": batch_size},
+        {"$project": {
+            TOUCHED_FIELD: 1,
+            "followers": 1,
+            "following": 1,
+            "actualFollowers": distinct_size("followers_list"),
+            "actualFollowing": distinct_size("following_list"),
+            "followers_list": list_if_duplicated("followers_list"),
+            "following_list": list_if_duplicated("following_list"),
+        }},
+    ]))
+    if not users:
+        return None
+
+    operations = []
+    drifts = {}
+    stamps = {}
+    for user in users:
+        update_data = {}
+        user_drifts = []
+        for field, actual_field in (("followers", "actualFollowers"), ("following", "actualFollowing")):
+            drift = abs((user.get(field) or 0) - user[actual_field])
+            if drift:
+                update_data[field] = user[actual_field]
+            list_field = f"{field}_list"
+            deduped = list_field in user
+            if deduped:
+                update_data[list_field] = dedupe(user[list_field])
+            if drift or deduped:
+                record_drift(metrics[field]["observed"], drift, deduped)
+                user_drifts.append((field, drift, deduped))
+        if update_data:
+            drifts[user["_id"]] = user_drifts
+            stamps[user["_id"]] = user[TOUCHED_FIELD]
+            operations.append(UpdateOne(
+                {"_id": user["_id"], TOUCHED_FIELD: user[TOUCHED_FIELD]},
+                {"$set": update_data}
+            ))
+
+    if operations:
+        result = db.users.bulk_write(operations, ordered=False)
+        metrics["users"]["repaired"] += result.modified_count
+        for user_id in applied_updates(db.users, stamps, result.modified_count):
+            for field, drift, deduped in drifts[user_id]:
+                record_drift(metrics[field]["repaired"], drift, deduped)
+    metrics["users"]["scanned"] += len(users)
+
+    last = users[-1]
+    return last[TOUCHED_FIELD], last["_id"]
+
+
+def run_reconciliation(db, batch_size=DEFAULT_BATCH_SIZE, max_batches=None,
+                       safety_lag_seconds=DEFAULT_SAFETY_LAG_SECONDS):
+    """Reconcile every counter touched since the last checkpoint.
+
+    Work is done in batches of `batch_size` documents and the checkpoint is
+    saved after each batch, so an interrupted run resumes where it stopped.
+    `max_batches` bounds the work done per collection in a single run.
+    Documents stamped within `safety_lag_seconds` of the server's clock are
+    left for the next run.
+    Returns documents scanned/repaired per collection and, per counter, the
+    drift observed and the drift whose repair was applied.
+    """
+    ensure_indexes(db)
+    until = server_time(db) - timedelta(seconds=safety_lag_seconds)
+    metrics = {
+        "tweets": {"scanned": 0, "repaired": 0},
+        "users": {"scanned": 0, "repaired": 0},
+        "replies": new_metrics(),
+        "followers": new_metrics(),
+        "following": new_metrics(),
+    }
+
+    jobs = (
+        ("tweets", reconcile_tweets_batch),
+        ("users", reconcile_users_batch),
+    )
+    for collection_name, reconcile_batch in jobs:
+        touched_at, last_id = load_checkpoint(db, collection_name)
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            position = reconcile_batch(db, touched_at, last_id, until, batch_size, metrics)
+            if position is None:
+                break
+            touched_at, last_id = position
+            save_checkpoint(db, collection_name, touched_at, last_id)
+            batches += 1
+        logger.info(
+            f"Reconciled {collection_name} in {batches} batch(es): "
+            f"scanned={metrics[collection_name]['scanned']} repaired={metrics[collection_name]['repaired']}"
+        )
+
+    for counter in ("replies", "followers", "following"):
+        for kind in ("observed", "repaired"):
+            stats = metrics[counter][kind]
+            logger.info(
+                f"{counter} {kind}: drifted={stats['documents']} "
+                f"totalDrift={stats['totalDrift']} maxDrift={stats['maxDrift']} "
+                f"deduped={stats['deduped']}"
+            )
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile denormalised reply and follower counters")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-batches", type=int, default=None,
+                        help="Stop after this many batches per collection")
+    parser.add_argument("--safety-lag-seconds", type=int, default=DEFAULT_SAFETY_LAG_SECONDS,
+                        help="Leave documents stamped this recently for the next run")
+    args = parser.parse_args()
+
+    # Importing the app initialises the shared MongoDB connection
+    from app import app  # noqa: F401
+    from config import mongo
+
+    run_reconciliation(mongo.db, batch_size=args.batch_size, max_batches=args.max_batches,
+                       safety_lag_seconds=args.safety_lag_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ import axios from "axios";
 interface TweetContextType {
   tweets: Tweet[];
   isLoading: boolean;
+  hasMoreTweets: boolean;
+  loadMoreTweets: () => Promise<void>;
   postTweet: (
     content: string,
     images?: string[],
@@ -28,6 +30,9 @@ interface TweetContextType {
   deleteComment: (commentId: string, tweetId: string) => Promise<boolean>;
 }
 
+// Tweets requested per page of the feed
+const PAGE_SIZE = 20;
+
 // Sample initial tweets
 const INITIAL_TWEETS: Tweet[] = [
   {
@@ -95,46 +100,59 @@ export const TweetProvider: React.FC<{ children: ReactNode }> = ({
   const [tweets, setTweets] = useState<Tweet[]>([]);
   const [bookmarks, setBookmarks] = useState<Tweet[]>([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [hasMoreTweets, setHasMoreTweets] = useState(false);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const { currentUser } = useAuth();
 
+  // Fetch one page of the feed, continuing below the given tweet if any
+  const fetchTweetPage = async (after?: Tweet): Promise<Tweet[]> => {
+    const params: Record<string, string | number> = { limit: PAGE_SIZE };
+    if (after) {
+      params.before = after.createdAt;
+      params.beforeId = after.id;
+    }
+    const response = await axios.get("/api/tweets", { params });
+    console.log("Fetched tweets from API:", response.data);
+    setHasMoreTweets(response.data.length === PAGE_SIZE);
+
+    // Process the tweets to include proper user objects
+    const processedTweets = await Promise.all(
+      response.data.map(async (tweet: any) => {
+        try {
+          // Get author info for each tweet
+          const authorResponse = await axios.get(
+            `/api/users/${tweet.authorId}`
+          );
+          return {
+            id: tweet.id,
+            content: tweet.content,
+            author: authorResponse.data,
+            createdAt: tweet.createdAt,
+            likes: tweet.likes || 0,
+            retweets: tweet.retweets || 0,
+            replies: tweet.replies || 0,
+            images: tweet.images || [],
+            location: tweet.location || "",
+            scheduledDate: tweet.scheduledDate || "",
+          };
+        } catch (error) {
+          console.error("Error fetching author for tweet:", error);
+          return null;
+        }
+      })
+    );
+
+    return processedTweets.filter((tweet) => tweet !== null);
+  };
+
   // Add a function to fetch tweets from the backend
   const fetchTweets = async () => {
     setIsLoading(true);
     try {
-      const response = await axios.get("/api/tweets");
-      console.log("Fetched tweets from API:", response.data);
-
-      // Process the tweets to include proper user objects
-      const processedTweets = await Promise.all(
-        response.data.map(async (tweet: any) => {
-          try {
-            // Get author info for each tweet
-            const authorResponse = await axios.get(
-              `/api/users/${tweet.authorId}`
-            );
-            return {
-              id: tweet.id,
-              content: tweet.content,
-              author: authorResponse.data,
-              createdAt: tweet.createdAt,
-              likes: tweet.likes || 0,
-              retweets: tweet.retweets || 0,
-              replies: tweet.replies || 0,
-              images: tweet.images || [],
-              location: tweet.location || "",
-              scheduledDate: tweet.scheduledDate || "",
-            };
-          } catch (error) {
-            console.error("Error fetching author for tweet:", error);
-            return null;
-          }
-        })
-      );
-
-      const validTweets = processedTweets.filter((tweet) => tweet !== null);
-      setTweets(validTweets);
+      setTweets(await fetchTweetPage());
     } catch (error) {
       console.error("Error fetching tweets:", error);
+      setHasMoreTweets(false);
       // Fallback to local storage or initial tweets
       const storedTweets = localStorage.getItem("tweets");
       setTweets(storedTweets ? JSON.parse(storedTweets) : INITIAL_TWEETS);
@@ -143,6 +161,26 @@ export const TweetProvider: React.FC<{ children: ReactNode }> = ({
     }
   };
 
+  // Append the next page of older tweets to the feed
+  const loadMoreTweets = async () => {
+    if (isLoadingMore || tweets.length === 0) return;
+    setIsLoadingMore(true);
+    try {
+      const olderTweets = await fetchTweetPage(tweets[tweets.length - 1]);
+      setTweets((prevTweets) => {
+        const seen = new Set(prevTweets.map((tweet) => tweet.id));
+        return [
+          ...prevTweets,
+          ...olderTweets.filter((tweet) => !seen.has(tweet.id)),
+        ];
+      });
+    } catch (error) {
+      console.error("Error loading more tweets:", error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     // On mount, try to fetch tweets
     fetchTweets();
@@ -466,6 +504,8 @@ export const TweetProvider: React.FC<{ children: ReactNode }> = ({
   const value = {
     tweets,
     isLoading,
+    hasMoreTweets,
+    loadMoreTweets,
     postTweet,
     likeTweet,
     retweetTweet,
@@ -23,6 +23,18 @@ const Discover: React.FC = () => {
       try {
         setIsLoading(true);
         console.log("Fetching users with userId:", currentUser.id); // Debug
+        // Prefer friends-of-friends suggestions, fall back to everyone
+        try {
+          const suggestions = await axios.get(
+            `/api/users/${currentUser.id}/suggestions`
+          );
+          if (suggestions.data.length > 0) {
+            setUsers(suggestions.data);
+            return;
+          }
+        } catch (error) {
+          console.error("Error fetching suggestions:", error);
+        }
         const response = await axios.get(`/api/users?userId=${currentUser.id}`);
         console.log("API response:", response.data); // Debug
         setUsers(response.data);
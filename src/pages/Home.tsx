@@ -43,7 +43,7 @@ const MOCK_TWEETS: Tweet[] = [
 ];
 
 const Home = () => {
-  const { tweets, isLoading } = useTweets();
+  const { tweets, isLoading, hasMoreTweets, loadMoreTweets } = useTweets();
   const [tweetDeleted, setTweetDeleted] = useState(false);
 
   // Reset the tweetDeleted state after a short delay
@@ -84,6 +84,14 @@ const Home = () => {
                 onDelete={() => setTweetDeleted(true)}
               />
             ))}
+            {hasMoreTweets && (
+              <button
+                onClick={loadMoreTweets}
+                className="w-full p-4 text-blue-500 hover:bg-gray-900 transition"
+              >
+                Load more
+              </button>
+            )}
           </div>
         ) : (
           <div className="p-8 text-center text-gray-500">